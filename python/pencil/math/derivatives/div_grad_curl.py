@@ -404,18 +404,22 @@ def curl2(
     curl2_value = np.zeros(f.shape)
 
     if coordinate_system == "cartesian":
+        # Each diagonal derivative enters two components; take it only once.
+        dfx_dx = xder(f[0], dx_1=dx_1)
+        dfy_dy = yder(f[1], dy_1=dy_1)
+        dfz_dz = zder(f[2], dz_1=dz_1)
         curl2_value[0] = (
-            xder(yder(f[1], dy_1=dy_1) + zder(f[2], dz_1=dz_1), dx_1=dx_1)
+            xder(dfy_dy + dfz_dz, dx_1=dx_1)
             - yder2(f[0], dy_1=dy_1, dy_tilde=dy_tilde)
             - zder2(f[0], dz_1=dz_1, dz_tilde=dz_tilde)
         )
         curl2_value[1] = (
-            yder(xder(f[0], dx_1=dx_1) + zder(f[2], dz_1=dz_1), dy_1=dy_1)
+            yder(dfx_dx + dfz_dz, dy_1=dy_1)
             - xder2(f[1], dx_1=dx_1, dx_tilde=dx_tilde)
             - zder2(f[1], dz_1=dz_1, dz_tilde=dz_tilde)
         )
         curl2_value[2] = (
-            zder(xder(f[0], dx_1=dx_1) + yder(f[1], dy_1=dy_1), dz_1=dz_1)
+            zder(dfx_dx + dfy_dy, dz_1=dz_1)
             - xder2(f[2], dx_1=dx_1, dx_tilde=dx_tilde)
             - yder2(f[2], dy_1=dy_1, dy_tilde=dy_tilde)
         )
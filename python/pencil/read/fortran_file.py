@@ -1,5 +1,6 @@
+import mmap
 import scipy
-from scipy.io import FortranFile
+from scipy.io import FortranFile, FortranFormattingError
 import numpy as np
 
 class FortranFileExt(FortranFile):
@@ -177,3 +178,76 @@ class FortranFileExt(FortranFile):
             return data[0]
         else:
             return tuple(data)
+
+    def read_record_count(self, dtype, count):
+        """
+        Reads a record of a single type that should hold `count` items.
+
+        Parameters
+        ----------
+        dtype : dtype
+            Data type specifying the size and endianness of the data.
+        count : int
+            Expected number of items in the record.
+
+        Returns
+        -------
+        data : ndarray
+            A 1-D array object.
+
+        Notes
+        -----
+        Records of any other size are read through read_record().
+        """
+        dtype = np.dtype(dtype)
+        start_pos = self._fp.tell()
+        size = self._read_size(eof_ok=True)
+        if size != count * dtype.itemsize:
+            self._fp.seek(start_pos)
+            return self.read_record(dtype=dtype)
+
+        data = np.fromfile(self._fp, dtype=dtype, count=count)
+        if len(data) != count:
+            raise FortranFormattingError(
+                "End of file in the middle of a record")
+        if self._read_size() != size:
+            raise ValueError('Sizes do not agree in the header and footer for '
+                             'this record - check header dtype')
+        return data
+
+    def map_record(self, dtype):
+        """
+        Maps a record of a single type into memory instead of reading it.
+
+        Parameters
+        ----------
+        dtype : dtype
+            Data type specifying the size and endianness of the data.
+
+        Returns
+        -------
+        data : ndarray
+            A read-only 1-D array backed by the file's pages; it stays
+            valid after the file is closed.
+
+        Notes
+        -----
+        Records split into subrecords are read through read_record().
+        """
+        dtype = np.dtype(dtype)
+        start_pos = self._fp.tell()
+        size = self._read_size(eof_ok=True)
+        if size < 0 or size % dtype.itemsize != 0:
+            self._fp.seek(start_pos)
+            return self.read_record(dtype=dtype)
+
+        data_pos = self._fp.tell()
+        self._fp.seek(size, 1)
+        if self._read_size() != size:
+            raise ValueError('Sizes do not agree in the header and footer for '
+                             'this record - check header dtype')
+        if size == 0:
+            return np.empty(0, dtype=dtype)
+        mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(mm, dtype=dtype, count=size // dtype.itemsize,
+                             offset=data_pos)
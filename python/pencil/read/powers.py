@@ -7,12 +7,153 @@ Contains the classes and methods to read the power spectra.
 """
 
 import os
+import mmap
 import numpy as np
 from pencil import read
 from pencil.util import ffloat, copy_docstring
 import re
 import warnings
-import functools
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# Buffer size for reading the spectrum files.
+_BUFFER_SIZE = 1 << 18
+
+# Spectrum files are named power*.dat; the group is the name of the spectrum.
+_POWER_RE = re.compile(r"power_?([^.]*).*\.dat$")
+_POWER_XY_RE = re.compile(r"power.*_xy\.dat$")
+
+# Complex numbers are written as (re, im); blanking out the punctuation leaves
+# the real and imaginary parts interleaved.
+_COMPLEX_TABLE = bytes.maketrans(b"(),", b"   ")
+
+
+def _count_tokens(buf):
+    """
+    Count the whitespace-separated tokens in buf (bytes).
+    """
+    chars = np.frombuffer(buf, dtype=np.uint8)
+    if chars.size == 0:
+        return 0
+    # Every token starts at a non-whitespace character after whitespace.
+    space = chars <= ord(" ")
+    return int(not space[0]) + int(np.count_nonzero(space[:-1] & ~space[1:]))
+
+
+def _parse_floats(buf, dtype=float):
+    """
+    Parse a whitespace-separated string (or bytes) of numbers into a 1D array.
+
+    The whole string is handed to numpy's C parser; only if that fails
+    (malformed Fortran output, see ffloat) is it parsed token by token.
+    """
+    if isinstance(buf, str):
+        buf = buf.encode()
+    try:
+        values = np.fromstring(buf, sep=" ", dtype=dtype)
+    except ValueError:
+        pass
+    else:
+        # Older numpy versions only warn about unparseable data and return
+        # the numbers before it. The readers run in threads, so the warning
+        # cannot be turned into an error (the warnings filters are global);
+        # a short parse is detected by counting the tokens instead.
+        if values.size == _count_tokens(buf):
+            return values
+    return np.fromiter(map(ffloat, buf.decode().split()), dtype=dtype)
+
+
+def _map_rest(f):
+    """
+    Return the rest of the binary file object f, from its current position,
+    as bytes read through a memory map.
+    """
+    offset = f.tell()
+    if os.fstat(f.fileno()).st_size <= offset:
+        # Empty files cannot be mapped.
+        return b""
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[offset:]
+
+
+def _read_cached(reader, options, power_name, file_name, datadir, *args):
+    """
+    Call one of the Power._read_power* readers, caching the returned
+    attributes in datadir/.file_name.npz.
+
+    options is a tuple of the integer or boolean settings (nk, lcomplex, ...)
+    the reader's output depends on. The cache is only used if it was written
+    for a file of the same size and modification time and with the same
+    options; otherwise the file is parsed and the cache rewritten.
+    """
+    source_stat = os.stat(os.path.join(datadir, file_name))
+    key = np.array(
+        [source_stat.st_mtime_ns, source_stat.st_size, *options], dtype=np.int64
+        )
+    cache_file = os.path.join(datadir, f".{file_name}.npz")
+
+    try:
+        with np.load(cache_file) as cached:
+            if np.array_equal(cached["_source_stat"], key):
+                return {
+                    name: cached[name].item() if cached[name].ndim == 0 else cached[name]
+                    for name in cached.files
+                    if name != "_source_stat"
+                    }
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass
+
+    attrs = reader(power_name, file_name, datadir, *args)
+    try:
+        np.savez(cache_file, _source_stat=key, **attrs)
+    except OSError:
+        warnings.warn(f"Could not write cache file {cache_file}.")
+    return attrs
+
+
+def _nk_xyz(dim, grid):
+    """
+    Number of k-vectors of the power spectra, see Power._get_nk_xyz.
+
+    dim and grid are the objects returned by read.dim and read.grid; grid
+    is None if grid.dat could not be found.
+    """
+    if grid is None:
+        # KG: Handling this case because there is no grid.dat in `tests/input/serial-1/proc0` and we don't want the test to fail. Should we just drop this and add a grid.dat in the test input?
+        warnings.warn("grid.dat not found. Assuming the box is cubical.")
+        return int(dim.nxgrid/2)
+
+    Lx = grid.Lx
+    Ly = grid.Ly
+    Lz = grid.Lz
+
+    nx = dim.nx
+    ny = dim.ny
+    nz = dim.nz
+
+    L_min = np.inf
+
+    if nx != 1:
+        L_min = min(L_min, Lx)
+    if ny != 1:
+        L_min = min(L_min, Lz)
+    if nz != 1:
+        L_min = min(L_min, Lz)
+    if L_min == np.inf:
+        L_min = 2*np.pi
+
+    nk = np.inf
+    if nx != 1:
+        nk = min(nk, np.round(nx*L_min/(2*Lx)))
+    if ny != 1:
+        nk = min(nk, np.round(ny*L_min/(2*Ly)))
+    if nz != 1:
+        nk = min(nk, np.round(nz*L_min/(2*Lz)))
+    if nk == np.inf:
+        nk = 1
+
+    return int(nk)
 
 
 class Power(object):
@@ -26,14 +167,34 @@ class Power(object):
         """
 
         self.t = []
+        # The spectra, keyed by name; see __getattr__.
+        self._arrays = {}
+
+    def __getattr__(self, name):
+        # Only called if name is not a regular attribute.
+        try:
+            return self.__dict__["_arrays"][name]
+        except KeyError:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+                ) from None
+
+    def __dir__(self):
+        # So that tab completion also offers the spectra.
+        return sorted(set(super().__dir__()) | set(self._arrays))
 
     def keys(self):
         for i in self.__dict__.keys():
+            if not i == "_arrays":
+                print(i)
+        for i in self._arrays.keys():
             print(i)
 
-    def read(self, datadir="data", file_name=None, quiet=False, time_range=None):
+    def read(
+        self, datadir="data", file_name=None, quiet=False, time_range=None, cache=False
+        ):
         """
-        read(datadir='data', file_name='', quiet=False)
+        read(datadir='data', file_name='', quiet=False, cache=False)
 
         Read the power spectra.
 
@@ -50,6 +211,11 @@ class Power(object):
         quiet : bool
             Flag for switching off output.
 
+        cache : bool
+            If True, store the parsed spectra of each file in a hidden .npz
+            file next to it (e.g. .power_kin.dat.npz), and reuse it on later
+            reads as long as the spectrum file has not changed.
+
         Returns
         -------
         Class containing the different power spectrum as attributes.
@@ -75,47 +241,89 @@ class Power(object):
             if not quiet:
                 print("Reading only ", file_name)
 
-            if os.path.isfile(os.path.join(datadir, file_name)):
-                if file_name[:5] == "power" and file_name[-4:] == ".dat":
-                    if file_name[:6] == "power_":
-                        power_list.append(file_name.split(".")[0][6:])
-                        if not quiet:
-                            print("appending", file_name.split(".")[0][6:])
-                    else:
-                        power_list.append(file_name.split(".")[0][5:])
-                        if not quiet:
-                            print("appending", file_name.split(".")[0][5:])
-
-                    file_list.append(file_name)
-            else:
+            if not os.path.isfile(os.path.join(datadir, file_name)):
                 raise ValueError(f"File {file_name} does not exist.")
-
+            file_names = [file_name]
         else:
-            for file_name in os.listdir(datadir):
-                if file_name[:5] == "power" and file_name[-4:] == ".dat":
-                    if file_name[:6] == "power_":
-                        power_list.append(file_name.split(".")[0][6:])
-                    else:
-                        power_list.append(file_name.split(".")[0][5:])
-                    file_list.append(file_name)
+            with os.scandir(datadir) as entries:
+                file_names = [entry.name for entry in entries]
+
+        for name in file_names:
+            match = _POWER_RE.match(name)
+            if match:
+                power_name = match[1]
+                if file_name is not None and not quiet:
+                    print("appending", power_name)
+                power_list.append(power_name)
+                file_list.append(name)
+
+        # Read the simulation metadata once for all the files.
+        if file_list:
+            dim = read.dim(datadir=datadir)
+            try:
+                grid = read.grid(datadir=datadir, trim=True, quiet=True)
+            except FileNotFoundError:
+                grid = None
+        if any(_POWER_XY_RE.match(file_name) for file_name in file_list):
+            param = read.param(datadir=datadir)
+        else:
+            param = None
+        nk = None
 
         # Read the power spectra.
+        tasks = []
         for power_name, file_name in zip(power_list, file_list):
             if not quiet:
                 print(file_name)
 
-            if re.match("power.*_xy.dat", file_name):
-                self._read_power2d(power_name, file_name, datadir)
+            if _POWER_XY_RE.match(file_name):
+                reader, args = self._read_power2d, (dim, param, grid)
+                options = (
+                    dim.nxgrid,
+                    dim.nygrid,
+                    dim.nzgrid,
+                    param.lcomplex,
+                    param.lintegrate_shell,
+                    param.lintegrate_z,
+                    )
             elif (
                 file_name == "poweruz_x.dat"
                 or file_name == "powerux_x.dat"
                 or file_name == "poweruy_x.dat"
                 ):
-                self._read_power_1d(power_name, file_name, datadir)
-            elif file_name == "power_krms.dat":
-                self._read_power_krms(power_name, file_name, datadir)
+                reader, args = self._read_power_1d, (dim,)
+                options = (dim.nxgrid,)
+            else:
+                if nk is None:
+                    if type(self)._get_nk_xyz is Power._get_nk_xyz:
+                        # Reuse the dim and grid read above.
+                        nk = _nk_xyz(dim, grid)
+                    else:
+                        nk = self._get_nk_xyz(datadir)
+                if file_name == "power_krms.dat":
+                    reader, args = self._read_power_krms, (nk,)
+                else:
+                    reader, args = self._read_power, (nk,)
+                options = (nk,)
+            tasks.append(
+                (power_name, reader, options, (power_name, file_name, datadir, *args))
+                )
+
+        # The files are independent, so they are read concurrently. The
+        # readers return their attributes, which are set here in file order.
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(tasks)))) as executor:
+            if cache:
+                futures = [
+                    executor.submit(_read_cached, reader, options, *args)
+                    for _, reader, options, args in tasks
+                    ]
             else:
-                self._read_power(power_name, file_name, datadir)
+                futures = [executor.submit(reader, *args) for _, reader, _, args in tasks]
+            for (power_name, _, _, _), future in zip(tasks, futures):
+                attrs = future.result()
+                self._arrays[power_name] = attrs.pop(power_name)
+                for key, value in attrs.items():
+                    setattr(self, key, value)
         if time_range:
             if isinstance(time_range, list):
                 time_range = time_range
@@ -132,60 +340,43 @@ class Power(object):
                 if time >= start_time:
                     if time <= end_time:
                         ilist.append(i)
-            for key in self.__dict__.keys():
+            self.t = self.t[ilist]
+            for key, value in self._arrays.items():
                 if not key=="krms":
-                    tmp = self.__getattribute__(key)[ilist]
-                    self.__delattr__(key)
-                    setattr(self, key, tmp)
+                    self._arrays[key] = value[ilist]
 
-    def _read_power2d(self, power_name, file_name, datadir):
+    def _read_power2d(self, power_name, file_name, datadir, dim, param, grid):
         """
         Handles output of power_xy subroutine.
+
+        Returns a dict of the attributes to set.
         """
-        dim = read.dim(datadir=datadir)
-        param = read.param(datadir=datadir)
+        attrs = {}
 
-        with open(os.path.join(datadir, file_name), "r") as f:
+        with open(os.path.join(datadir, file_name), "rb", buffering=_BUFFER_SIZE) as f:
             _ = f.readline()  # ignore first line
-            header = f.readline()
+            header = f.readline().decode().split()
+
+            def _read_n(name):
+                # The header gives the length of each vector as e.g. "k_x (32)".
+                return int(header[header.index(name) + 1].split(")")[0][1:])
 
             # Get k vectors:
             if param.lintegrate_shell:
-                nk = int(
-                    header
-                    .split()[header.split().index("k") + 1]
-                    .split(")")[0][1:]
+                nk = _read_n("k")
+                attrs["k"] = _parse_floats(
+                    b" ".join(f.readline() for _ in range((nk + 7) // 8))
                     )
-                k = []
-                for _ in range(int(np.ceil(nk / 8))):
-                    line = f.readline()
-                    k.extend([float(j) for j in line.split()])
-                k = np.array(k)
-                self.k = k
             else:
-                nkx = int(
-                    header
-                    .split()[header.split().index("k_x") + 1]
-                    .split(")")[0][1:]
+                nkx = _read_n("k_x")
+                attrs["kx"] = _parse_floats(
+                    b" ".join(f.readline() for _ in range((nkx + 7) // 8))
                     )
-                kx = []
-                for _ in range(int(np.ceil(nkx / 8))):
-                    line = f.readline()
-                    kx.extend([float(j) for j in line.split()])
-                kx = np.array(kx)
-                self.kx = kx
-
-                nky = int(
-                    header
-                    .split()[header.split().index("k_y") + 1]
-                    .split(")")[0][1:]
+
+                nky = _read_n("k_y")
+                attrs["ky"] = _parse_floats(
+                    b" ".join(f.readline() for _ in range((nky + 7) // 8))
                     )
-                ky = []
-                for _ in range(int(np.ceil(nky / 8))):
-                    line = f.readline()
-                    ky.extend([float(j) for j in line.split()])
-                ky = np.array(ky)
-                self.ky = ky
 
                 nk = nkx * nky
 
@@ -194,148 +385,107 @@ class Power(object):
                 nzpos = 1
             else:
                 ini = f.tell()
-                line = f.readline()
+                line = f.readline().decode()
                 if "z-pos" in line:
                     nzpos = int(re.search(r"\((\d+)\)", line)[1])
-                    block_size = int(np.ceil(nzpos / 8))
-                    zpos = []
-                    for _ in range(block_size):
-                        line = f.readline()
-                        zpos.extend([ffloat(j) for j in line.split()])
-                    self.zpos = np.array(zpos)
+                    block_size = (nzpos + 7) // 8
+                    zpos = " ".join(f.readline().decode() for _ in range(block_size))
+                    attrs["zpos"] = _parse_floats(zpos)
                 else:
                     # there was no list of z-positions, so reset the position of the reader.
                     f.seek(ini)
 
                     nzpos = dim.nzgrid
-                    grid = read.grid(datadir=datadir, trim=True, quiet=True)
-                    self.zpos = grid.z
+                    if grid is None:
+                        raise FileNotFoundError(
+                            f"{file_name} has no z-positions and grid.dat was not found."
+                            )
+                    attrs["zpos"] = grid.z
 
             # Now read the rest of the file
-            time = []
-            if param.lcomplex:
-                power_array = np.array([], dtype=np.csingle)
-            else:
-                power_array = np.array([], dtype=np.single)
-
-            if param.lintegrate_shell:
-                block_size = np.ceil(nk / 8) * nzpos + 1
-            else:
-                block_size = np.ceil(int(nk * nzpos) / 8) + 1
-
-            for line_idx, line in enumerate(f):
-                if line_idx % block_size == 0:
-                    time.append(float(line.strip()))
+            buf = _map_rest(f)
 
-                    power_array.resize([len(time), nzpos*nk])
-                    ik = 0
-                else:
-                    lsp = line.strip().split()
-
-                    if param.lcomplex:
-                        # complex power spectrum
-                        real = lsp[0::2]
-                        imag = lsp[1::2]
-                        for a, b in zip(real, imag):
-                            power_array[-1,ik] = ffloat(a) + 1j * ffloat(b)
-                            ik += 1
-                    else:
-                        for value_string in lsp:
-                            power_array[-1,ik] = ffloat(value_string)
-                            ik += 1
+        # Each record is a single time value followed by the spectrum, so the
+        # whole file can be parsed into one array and the time column split off.
+        nvalues = nk * nzpos
+        if param.lcomplex:
+            nvalues *= 2
+        values = _parse_floats(buf, dtype=np.single).reshape([-1, nvalues + 1])
+        time = values[:, 0]
+        power_array = values[:, 1:]
 
-        time = np.array(time)
+        if param.lcomplex:
+            # Real and imaginary parts are interleaved.
+            power_array = power_array.view(np.csingle)
 
         if param.lintegrate_shell or (dim.nxgrid == 1 or dim.nygrid == 1):
             power_array = power_array.reshape([len(time), nzpos, nk])
         else:
             power_array = power_array.reshape([len(time), nzpos, nky, nkx])
 
-        self.t = time.astype(np.single)
-        self.nzpos = nzpos
-        setattr(self, power_name, power_array)
+        attrs["t"] = time
+        attrs["nzpos"] = nzpos
+        attrs[power_name] = power_array
+        return attrs
 
-    def _read_power_1d(self, power_name, file_name, datadir):
+    def _read_power_1d(self, power_name, file_name, datadir, dim):
         """
         Handle output of subroutine power_1d
+
+        Returns a dict of the attributes to set.
         """
-        dim = read.dim(datadir=datadir)
+        nk = int(dim.nxgrid / 2)
+        block_size = (nk + 7) // 8 + 1
 
-        block_size = np.ceil(int(dim.nxgrid / 2) / 8.0) + 1
-
-        time = []
-        power_array = []
-        with open(os.path.join(datadir, file_name), "r") as f:
-            for line_idx, line in enumerate(f):
-                if line_idx % block_size == 0:
-                    time.append(float(line.strip()))
-                elif line.find(",") == -1:
-                    # if the line does not contain ',', assume it represents a series of real numbers.
-                    for value_string in line.strip().split():
-                        power_array.append(float(value_string))
-                else:
-                    # Assume we have complex numbers.
-                    for value_string in line.strip().split("( ")[1:]:
-                        value_string = (
-                            value_string.replace(")", "j")
-                            .strip()
-                            .replace(", ", "")
-                            .replace(" ", "+")
-                        )
-                        power_array.append(complex(value_string))
-
-        time = np.array(time)
-        power_array = np.array(power_array).reshape([len(time), int(dim.nxgrid / 2)])
-        self.t = time
-        setattr(self, power_name, power_array)
-
-    def _read_power_krms(self, power_name, file_name, datadir):
+        with open(os.path.join(datadir, file_name), "rb", buffering=_BUFFER_SIZE) as f:
+            lines = f.read().splitlines()
+
+        # Split off the time lines and parse all the spectra at once.
+        time = np.array(lines[::block_size], dtype=float)
+        del lines[::block_size]
+        buf = b" ".join(lines)
+
+        # If the data lines do not contain ',', assume they represent a series of real numbers.
+        if lines and b"," in lines[0]:
+            power_array = _parse_floats(buf.translate(_COMPLEX_TABLE)).view(complex)
+        else:
+            power_array = _parse_floats(buf)
+        # Raises, like the other readers, if the last record is incomplete.
+        power_array = power_array.reshape([len(time), nk])
+
+        return {"t": time, power_name: power_array}
+
+    def _read_power_krms(self, power_name, file_name, datadir, nk):
         """
         Read power_krms.dat.
+
+        Returns a dict of the attributes to set.
         """
-        nk = self._get_nk_xyz(datadir)
-        block_size = np.ceil(nk/8)
-
-        power_array = []
-        with open(os.path.join(datadir, file_name), "r") as f:
-            for line_idx, line in enumerate(f):
-                # KG: Is this file expected to contain extra lines? If not, the if below can be removed.
-                if line_idx < block_size:
-                    for value_string in line.strip().split():
-                        power_array.append(float(value_string))
-        power_array = (
-            np.array(power_array).reshape([nk]).astype(np.float32)
-        )
-        setattr(self, power_name, power_array)
+        with open(os.path.join(datadir, file_name), "rb", buffering=_BUFFER_SIZE) as f:
+            # The nk values are written 8 per line; any further lines are ignored.
+            buf = b" ".join(islice(f, (nk + 7) // 8))
 
-    def _read_power(self, power_name, file_name, datadir):
+        # Raises if the file holds fewer than nk values.
+        power_array = _parse_floats(buf, dtype=np.float32).reshape([nk])
+        return {power_name: power_array}
+
+    def _read_power(self, power_name, file_name, datadir, nk):
         """
         Handles output of power subroutine.
+
+        Returns a dict of the attributes to set.
         """
-        nk = self._get_nk_xyz(datadir)
-        block_size = np.ceil(nk/8) + 1
-
-        time = []
-        power_array = []
-        with open(os.path.join(datadir, file_name), "r") as f:
-            for line_idx, line in enumerate(f):
-                if line_idx % block_size == 0:
-                    time.append(float(line.strip()))
-                else:
-                    for value_string in line.strip().split():
-                        power_array.append(ffloat(value_string))
-
-        # Reformat into arrays.
-        time = np.array(time)
-        power_array = (
-            np.array(power_array)
-            .reshape([len(time), nk])
-            .astype(np.float32)
-        )
-        self.t = time.astype(np.float32)
-        setattr(self, power_name, power_array)
+        with open(os.path.join(datadir, file_name), "rb", buffering=_BUFFER_SIZE) as f:
+            buf = _map_rest(f)
+
+        # Each record is a single time value followed by nk values, so the
+        # whole file can be parsed in one go and the time column split off.
+        values = _parse_floats(buf, dtype=np.float32)
+        # Parsed straight into single precision, so the time and power
+        # columns can be handed out as views without further copies.
+        values = values.reshape([-1, nk + 1])
+        return {"t": values[:, 0], power_name: values[:, 1:]}
 
-    @functools.lru_cache(maxsize=128)
     def _get_nk_xyz(self, datadir):
         """
         See variable nk_xyz in power_spectrum.f90.
@@ -355,40 +505,8 @@ class Power(object):
         try:
             grid = read.grid(datadir=datadir, quiet=True)
         except FileNotFoundError:
-            # KG: Handling this case because there is no grid.dat in `tests/input/serial-1/proc0` and we don't want the test to fail. Should we just drop this and add a grid.dat in the test input?
-            warnings.warn("grid.dat not found. Assuming the box is cubical.")
-            return int(dim.nxgrid/2)
-
-        Lx = grid.Lx
-        Ly = grid.Ly
-        Lz = grid.Lz
-
-        nx = dim.nx
-        ny = dim.ny
-        nz = dim.nz
-
-        L_min = np.inf
-
-        if nx != 1:
-            L_min = min(L_min, Lx)
-        if ny != 1:
-            L_min = min(L_min, Lz)
-        if nz != 1:
-            L_min = min(L_min, Lz)
-        if L_min == np.inf:
-            L_min = 2*np.pi
-
-        nk = np.inf
-        if nx != 1:
-            nk = min(nk, np.round(nx*L_min/(2*Lx)))
-        if ny != 1:
-            nk = min(nk, np.round(ny*L_min/(2*Ly)))
-        if nz != 1:
-            nk = min(nk, np.round(nz*L_min/(2*Lz)))
-        if nk == np.inf:
-            nk = 1
-
-        return int(nk)
+            grid = None
+        return _nk_xyz(dim, grid)
 
 @copy_docstring(Power.read)
 def power(*args, **kwargs):
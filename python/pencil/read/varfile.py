@@ -3,6 +3,8 @@
 # Read the var files.
 # NB: the f array returned is C-ordered: f[nvar, nz, ny, nx]
 #     NOT Fortran as in Pencil (& IDL):  f[nx, ny, nz, nvar]
+#     The memory layout is the same as on disk, so f.T is the Fortran-ordered
+#     array without a copy.
 #
 # Authors:
 # J. Oishi (joishi@amnh.org)
@@ -13,17 +15,269 @@
 Contains the read class for the VAR file reading,
 some simulation attributes and the data cube.
 """
+import math
 import numpy as np
+import os
+import re
 import warnings
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pencil.math import natural_sort
 
+try:
+    # Optional Cython reader for Fortran unformatted files; much faster than
+    # scipy's FortranFile for the large f-array record. It does not handle
+    # records split into subrecords, see _has_split_record.
+    from cython_fortran_file import FortranFile as _CythonFortranFile
+except ImportError:
+    _CythonFortranFile = None
+
+# Splits digit runs off directory names for the natural sort of procN.
+_NATSORT_RE = re.compile(r"([0-9]+)")
+
+# Entries of the index object that are not variables of the f-array.
+_SKIP_KEYS = {"global_gg", "keys"}
+
+# Data directories known to hold a started simulation (see _is_started).
+_STARTED_DATADIRS = set()
+
+
+def _is_started(datadir):
+    """
+    Check whether the simulation in datadir has started, i.e. written
+    time_series.dat. Only positive answers are remembered, as a run that
+    has not started yet may do so later.
+    """
+    datadir = os.path.abspath(datadir)
+    if datadir in _STARTED_DATADIRS:
+        return True
+    if os.path.exists(os.path.join(datadir, "time_series.dat")):
+        _STARTED_DATADIRS.add(datadir)
+        return True
+    return False
+
+
+def _has_split_record(file_name):
+    """
+    Check whether the first record of a Fortran unformatted file is split
+    into subrecords, which gfortran does for records over 2 GiB and marks
+    with a negative record length.
+    """
+    with open(file_name, "rb") as infile:
+        marker = np.fromfile(infile, dtype=np.int32, count=1)
+    return len(marker) == 1 and marker[0] < 0
+
+
+def _proc_slices(ip, nloc, mloc, nghost, mglobal):
+    """
+    Global and local slices of the part of one axis a processor owns:
+    its interior plus the outer ghost zones at the ends of the domain.
+
+    Recall that in NumPy, slicing is NON-INCLUSIVE on the right end, ie,
+    x[0:4] will slice all of a 4-digit array, not produce an error like in idl.
+    """
+    i0loc = 0 if ip == 0 else nghost
+    i1loc = mloc
+    if ip * nloc + mloc < mglobal:
+        # The right ghost zones are interior to the next processor.
+        i1loc -= nghost
+    return slice(ip * nloc + i0loc, ip * nloc + i1loc), slice(i0loc, i1loc)
+
+
+_ThermoConsts = namedtuple(
+    "_ThermoConsts",
+    [
+        "cp",
+        "gamma",
+        "cv",
+        "cs20",
+        "lnrho0",
+        "lnTT0",
+        "rho0",
+        "gamma_m1",
+        "gamma_over_cp",
+    ],
+)
+
+
+def _thermo_consts(param, dtype=np.float64):
+    """
+    Scalar equation of state constants used by the thermodynamic magic
+    quantities tt, ss and pp, folded so that the array expressions only
+    need one operation per term. For dtype np.float32 they are returned as
+    np.float32 scalars, which do not promote single precision arrays.
+    """
+    cp = float(param.cp)
+    gamma = float(param.gamma)
+    cs0 = float(param.cs0)
+    cs20 = cs0 * cs0
+    gamma_m1 = gamma - 1.0
+    consts = _ThermoConsts(
+        cp=cp,
+        gamma=gamma,
+        cv=cp / gamma,
+        cs20=cs20,
+        # math.log is much cheaper than a ufunc call on a scalar; the logs
+        # stay np.float64, which promotes single precision data as before.
+        lnrho0=np.float64(math.log(param.rho0)),
+        lnTT0=np.float64(math.log(cs20 / (cp * gamma_m1))),
+        rho0=param.rho0,
+        gamma_m1=gamma_m1,
+        gamma_over_cp=gamma / cp,
+    )
+    if np.dtype(dtype) == np.float32:
+        consts = _ThermoConsts(*(np.float32(c) for c in consts))
+    return consts
+
+
+# Approximate size of the blocks the thermodynamic kernels work on: small
+# enough for the chain of operations on one block to stay in cache.
+_THERMO_BLOCK_BYTES = 1 << 20
+
+
+def _thermo_blocks(out):
+    """
+    Slices along the first axis of out, each covering roughly
+    _THERMO_BLOCK_BYTES of it.
+    """
+    if out.ndim == 0:
+        return [Ellipsis]
+    row_bytes = out.itemsize * int(np.prod(out.shape[1:]))
+    step = max(1, _THERMO_BLOCK_BYTES // max(row_bytes, 1))
+    return [slice(i, i + step) for i in range(0, out.shape[0], step)]
+
+
+def _thermo_map(kernel, out):
+    """
+    Apply kernel to each of the blocks of out (see _thermo_blocks), using
+    threads when there are several: NumPy releases the GIL in its ufunc
+    loops, so the blocks are computed in parallel.
+    """
+    blocks = _thermo_blocks(out)
+    nworkers = max(1, min(len(blocks), os.cpu_count() or 1))
+    if nworkers == 1:
+        for block in blocks:
+            kernel(block)
+    else:
+        with ThreadPoolExecutor(max_workers=nworkers) as executor:
+            # Consume the results to raise any exception from the kernel.
+            list(executor.map(kernel, blocks))
+
+
+def _thermo_out(out, shape, *operands):
+    """
+    Output array for a thermodynamic kernel: out if it has the given shape
+    and the dtype the operands promote to, else a new array.
+    """
+    dtype = np.result_type(*operands)
+    if out is not None and out.shape == shape and out.dtype == dtype:
+        return out
+    return np.empty(shape, dtype=dtype)
+
+
+def _compute_tt(ss, lnrho, consts, out=None):
+    """
+    Temperature from entropy and log density,
+    exp(lnTT0 + gamma/cp*ss + (gamma-1)*(lnrho-lnrho0)).
+
+    The expression is evaluated block by block (in parallel, see
+    _thermo_map) in place in the output array, so that no full-size
+    temporaries are allocated and each block only passes through memory
+    once. The output array can be passed as out, which may also be one of
+    the inputs, see _thermo_out.
+    """
+    tt = _thermo_out(out, ss.shape, ss, lnrho, consts.lnTT0, consts.lnrho0)
+
+    def kernel(block):
+        out = tt[block]
+        np.multiply(ss[block], consts.gamma_over_cp, out=out)
+        out += consts.lnTT0
+        scratch = np.subtract(lnrho[block], consts.lnrho0)
+        scratch *= consts.gamma_m1
+        out += scratch
+        np.exp(out, out=out)
+
+    _thermo_map(kernel, tt)
+    return tt
+
+
+def _compute_ss(lnTT, lnrho, consts, out=None):
+    """
+    Entropy from log temperature and log density,
+    cp/gamma*(lnTT - lnTT0 - (gamma-1)*(lnrho-lnrho0)), see _compute_tt.
+    """
+    ss = _thermo_out(out, lnTT.shape, lnTT, lnrho, consts.lnTT0, consts.lnrho0)
+
+    def kernel(block):
+        out = ss[block]
+        np.subtract(lnTT[block], consts.lnTT0, out=out)
+        scratch = np.subtract(lnrho[block], consts.lnrho0)
+        scratch *= consts.gamma_m1
+        out -= scratch
+        out *= consts.cv
+
+    _thermo_map(kernel, ss)
+    return ss
+
+
+def _compute_pp(ss, lnrho, consts, out=None):
+    """
+    Pressure from entropy and log density,
+    (cp-cv)*exp(lnTT0 + gamma/cp*ss + gamma*lnrho - (gamma-1)*lnrho0),
+    see _compute_tt.
+    """
+    pp = _thermo_out(out, ss.shape, ss, lnrho, consts.lnTT0, consts.lnrho0)
+
+    def kernel(block):
+        out = pp[block]
+        np.multiply(ss[block], consts.gamma_over_cp, out=out)
+        out += consts.lnTT0
+        out += consts.gamma * lnrho[block]
+        out -= consts.gamma_m1 * consts.lnrho0
+        np.exp(out, out=out)
+        out *= consts.cp - consts.cv
+
+    _thermo_map(kernel, pp)
+    return pp
+
+
+def _compute_pp_from_rho(ss, rho, consts, out=None):
+    """
+    Pressure from entropy and density, which avoids taking log(rho):
+    cs20/(gamma*rho0**(gamma-1))*exp(gamma/cp*ss)*rho**gamma, the same as
+    _compute_pp up to rounding. For gamma=5/3, rho**gamma is computed as
+    rho*cbrt(rho**2), which needs no exp/log at all.
+    """
+    pp = _thermo_out(out, ss.shape, ss, rho, consts.cs20, consts.rho0)
+    pp0 = consts.cs20 / (consts.gamma * consts.rho0 ** consts.gamma_m1)
+    gamma_eps = 4 * np.finfo(np.result_type(consts.gamma)).eps
+    five_thirds = abs(consts.gamma - 5.0 / 3.0) <= gamma_eps
+
+    def kernel(block):
+        out = pp[block]
+        np.multiply(ss[block], consts.gamma_over_cp, out=out)
+        np.exp(out, out=out)
+        out *= pp0
+        if five_thirds:
+            scratch = np.square(rho[block])
+            np.cbrt(scratch, out=scratch)
+            scratch *= rho[block]
+        else:
+            scratch = np.power(rho[block], consts.gamma)
+        out *= scratch
+
+    _thermo_map(kernel, pp)
+    return pp
+
+
 def var(*args, **kwargs):
     """
     var(var_file='', datadir='data', proc=-1, ivar=-1, quiet=True,
         trimall=False, magic=None, sim=None, precision='f', flist=None,
         timing=True, fbloc=True, lvec=True, lonlyvec=False, lpersist=False,
         range_x=None, range_y=None, range_z=None,
-        irange_x=None, irange_y=None, irange_z=None)
+        irange_x=None, irange_y=None, irange_z=None, magic_inplace=False,
+        keep_f=True)
 
     Read VAR files from Pencil Code. If proc < 0, then load all data
     and assemble, otherwise load VAR file from specified processor.
@@ -91,6 +345,14 @@ def var(*args, **kwargs):
      irange_[xyz] : 2-tuple of integer
          index range selection for subdomain
 
+     magic_inplace : bool
+         Compute the magic rho and tt in place of lnrho and lnTT (also in f),
+         which are then no longer available. Saves one copy of each field.
+
+     keep_f : bool
+         Keep f and the variables viewing it (uu, lnrho, ...). If False and
+         magic is given, only the magic fields are kept and f is released.
+
 
     Returns
     -------
@@ -123,16 +385,14 @@ def var(*args, **kwargs):
         # started = kwargs['sim'].started()
 
         started = True
-    elif "datadir" in kwargs.keys():
-        from os.path import join, exists
-
-        if exists(join(kwargs["datadir"], "time_series.dat")):
-            started = True
-    else:
-        from os.path import join, exists
-
-        if exists(join("data", "time_series.dat")):
-            started = True
+    elif not started:
+        if "datadir" in kwargs.keys():
+            datadir = kwargs["datadir"]
+        elif len(args) > 1 and isinstance(args[1], str):
+            datadir = args[1]
+        else:
+            datadir = "data"
+        started = _is_started(datadir)
 
     if not started:
         if "ivar" in kwargs:
@@ -198,7 +458,9 @@ class DataCube(object):
         range_z=None,
         irange_x=None,
         irange_y=None,
-        irange_z=None
+        irange_z=None,
+        magic_inplace=False,
+        keep_f=True,
     ):
         """
         read(var_file='', datadir='data', proc=-1, ivar=-1, quiet=True,
@@ -206,7 +468,8 @@ class DataCube(object):
              lpersist=False, dtype=np.float64, flist=None,
              timing=True, fbloc=True, lvec=True, lonlyvec=False,
              range_x=None, range_y=None, range_z=None,
-             irange_x=None, irange_y=None, irange_z=None)
+             irange_x=None, irange_y=None, irange_z=None,
+             magic_inplace=False, keep_f=True)
 
         Read VAR files from Pencil Code. If proc < 0, then load all data
         and assemble, otherwise load VAR file from specified processor.
@@ -273,6 +536,14 @@ class DataCube(object):
          irange_[xyz] : 2-tuple of integer
              index range selection for subdomain
 
+         magic_inplace : bool
+             Compute the magic rho and tt in place of lnrho and lnTT (also in f),
+             which are then no longer available. Saves one copy of each field.
+
+         keep_f : bool
+             Keep f and the variables viewing it (uu, lnrho, ...). If False and
+             magic is given, only the magic fields are kept and f is released.
+
         Returns
         -------
         DataCube
@@ -311,12 +582,12 @@ class DataCube(object):
             Record types provide the labels and id record for the peristent
             variables in the depricated fortran binary format
             """
-            record_types = {}
-            for key in read.record_types.keys():
-                if read.record_types[key][1] == "d":
-                    record_types[key] = (read.record_types[key][0], precision)
-                else:
-                    record_types[key] = read.record_types[key]
+            # Map each block id to its (label, record type).
+            id2entry = {}
+            for key, (block_id, typecode) in read.record_types.items():
+                if typecode == "d":
+                    typecode = precision
+                id2entry[block_id] = (key, typecode)
 
             try:
                 tmp_id = infile.read_record("h")
@@ -330,15 +601,14 @@ class DataCube(object):
                 block_id = tmp_id[0]
                 if block_id == 2000:
                     break
-                for key in record_types.keys():
-                    #Kishore: DANGER: there is a wrong assumption here that persistent variables must be scalars. A counter-example is forcing_location.
-                    if record_types[key][0] == block_id:
-                        tmp_val = infile.read_record(record_types[key][1])
-                        pers_obj.__setattr__(key, tmp_val[0])
-                        if not quiet:
-                            print(
-                                key, record_types[key][0], record_types[key][1], tmp_val
-                            )
+                entry = id2entry.get(block_id)
+                #Kishore: DANGER: there is a wrong assumption here that persistent variables must be scalars. A counter-example is forcing_location.
+                if entry is not None:
+                    key, typecode = entry
+                    tmp_val = infile.read_record(typecode)
+                    pers_obj.__setattr__(key, tmp_val[0])
+                    if not quiet:
+                        print(key, block_id, typecode, tmp_val)
             self.__setattr__("persist", pers_obj)
             return self
 
@@ -399,7 +669,7 @@ class DataCube(object):
 
             with h5py.File(file_name, "r") as tmp:
                 if range_x:
-                    x = (tmp["grid/x"][:]).astype(precision)
+                    x = (tmp["grid/x"][:]).astype(precision, copy=False)
                     irange_x = (np.where( (x>=range_x[0]) & (x<=range_x[1]) )[0][0],
                                 np.where( (x>=range_x[0]) & (x<=range_x[1]) )[0][-1]+1)
                 else:
@@ -409,9 +679,9 @@ class DataCube(object):
                         irange_x = (max(irange_x[0],0),min(irange_x[1]+1,tmp["settings/mx"][0]))
                         print("irange_x",type(irange_x), irange_x)
                 mx = irange_x[1]-irange_x[0]
-                x = (tmp["grid/x"][irange_x[0]:irange_x[1]]).astype(precision)
+                x = (tmp["grid/x"][irange_x[0]:irange_x[1]]).astype(precision, copy=False)
                 if range_y:
-                    y = (tmp["grid/y"][:]).astype(precision)
+                    y = (tmp["grid/y"][:]).astype(precision, copy=False)
                     irange_y = (np.where( (y>=range_y[1]) & (y<=range_y[2]) )[0][0],
                                 np.where( (y>=range_y[1]) & (y<=range_y[2]) )[0][-1]+1)
                 else:
@@ -421,10 +691,10 @@ class DataCube(object):
                         irange_y = (max(irange_y[0],0),min(irange_y[1],tmp["settings/my"][0]))
                         print("irange_y",type(irange_y), irange_y)
                 my = irange_y[1]-irange_y[0]
-                y = (tmp["grid/y"][irange_y[0]:irange_y[1]]).astype(precision)
+                y = (tmp["grid/y"][irange_y[0]:irange_y[1]]).astype(precision, copy=False)
 
                 if range_z:
-                    z = (tmp["grid/z"][:]).astype(precision)
+                    z = (tmp["grid/z"][:]).astype(precision, copy=False)
                     irange_z = [np.where( (z>=range_z[1]) & (z<=range_z[2]) )[0][0],
                                 np.where( (z>=range_z[1]) & (z<=range_z[2]) )[0][-1]+1]
                     irange_z = (irange_z[0][0], irange_z[0][-1]+1)
@@ -434,7 +704,7 @@ class DataCube(object):
                     else:
                         irange_z = (max(irange_z[0],0),min(irange_z[1],tmp["settings/mz"][0]))
                 mz = irange_z[1]-irange_z[0]
-                z = (tmp["grid/z"][irange_z[0]:irange_z[1]]).astype(precision)
+                z = (tmp["grid/z"][irange_z[0]:irange_z[1]]).astype(precision, copy=False)
 
                 if grid != None:
                     grid.restrict(irange_x,irange_y,irange_z)
@@ -450,19 +720,23 @@ class DataCube(object):
                 else:
                     self.f = np.zeros((total_vars, mz, my, mx), dtype=dtype)
 
+                # Let HDF5 convert each dataset while writing it straight
+                # into its slot of the global array.
                 for key in tmp["data"].keys():
                     if key in index.__dict__.keys():
-                        self.f[index.__getattribute__(key) - 1, :, :, :] = dtype(
-                                tmp["data/" + key][irange_z[0]:irange_z[1],
-                                                   irange_y[0]:irange_y[1],
-                                                   irange_x[0]:irange_x[1]]
+                        tmp["data/" + key].read_direct(
+                            self.f,
+                            np.s_[irange_z[0]:irange_z[1],
+                                  irange_y[0]:irange_y[1],
+                                  irange_x[0]:irange_x[1]],
+                            np.s_[index.__getattribute__(key) - 1],
                         )
-                t = (tmp["time"][()]).astype(precision)
-                dx = (tmp["grid/dx"][()]).astype(precision)
-                dy = (tmp["grid/dy"][()]).astype(precision)
-                dz = (tmp["grid/dz"][()]).astype(precision)
+                t = (tmp["time"][()]).astype(precision, copy=False)
+                dx = (tmp["grid/dx"][()]).astype(precision, copy=False)
+                dy = (tmp["grid/dy"][()]).astype(precision, copy=False)
+                dz = (tmp["grid/dz"][()]).astype(precision, copy=False)
                 if param.lshear:
-                    deltay = (tmp["persist/shear_delta_y"][(0)]).astype(precision)
+                    deltay = (tmp["persist/shear_delta_y"][(0)]).astype(precision, copy=False)
                 if lpersist:
                     pers_obj = _Persist()
                     nprocs = dim.nprocx * dim.nprocy * dim.nprocz
@@ -490,11 +764,10 @@ class DataCube(object):
                     var_file = "VAR" + str(ivar)
 
             if proc < 0:
-                proc_dirs = self.__natural_sort(
-                    filter(lambda s: s.startswith("proc"), os.listdir(datadir))
-                )
-                if proc_dirs.count("proc_bounds.dat") > 0:
-                    proc_dirs.remove("proc_bounds.dat")
+                with os.scandir(datadir) as entries:
+                    proc_dirs = self.__natural_sort(
+                        [e.name for e in entries if e.name.startswith("proc") and e.is_dir()]
+                    )
                 if param.lcollective_io:
                     # A collective IO strategy is being used
                     proc_dirs = ["allprocs"]
@@ -503,37 +776,48 @@ class DataCube(object):
             else:
                 proc_dirs = ["proc" + str(proc)]
 
-            # Set up the global array.
-            if not run2D:
-                self.f = np.zeros((total_vars, dim.mz, dim.my, dim.mx), dtype=precision)
-            else:
-                if dim.ny == 1:
-                    self.f = np.zeros((total_vars, dim.mz, dim.mx), dtype=precision)
+            # Set up the global array. Its C-ordered (nvar, mz, my, mx) layout
+            # matches the Fortran-ordered records, so every per-proc copy
+            # below moves contiguous x-rows. A single proc record is used as is.
+            if len(proc_dirs) > 1:
+                if not run2D:
+                    self.f = np.zeros((total_vars, dim.mz, dim.my, dim.mx), dtype=precision)
                 else:
-                    self.f = np.zeros((total_vars, dim.my, dim.mx), dtype=precision)
-
-            x = np.zeros(dim.mx, dtype=precision)
-            y = np.zeros(dim.my, dtype=precision)
-            z = np.zeros(dim.mz, dtype=precision)
-
-            for directory in proc_dirs:
+                    if dim.ny == 1:
+                        self.f = np.zeros((total_vars, dim.mz, dim.mx), dtype=precision)
+                    else:
+                        self.f = np.zeros((total_vars, dim.my, dim.mx), dtype=precision)
+
+            # Owned part of each proc's coordinates, by position along the axis.
+            x_segments = {}
+            y_segments = {}
+            z_segments = {}
+
+            def read_proc(directory):
+                """
+                Read the f-array and the time/grid record of one processor.
+                With several procs, the part of the f-array owned by this proc
+                is copied into the global array here; these parts are
+                disjoint, so the procs can be read concurrently.
+                """
                 if not param.lcollective_io:
-                    proc = int(directory[4:])
+                    iproc = int(directory[4:])
                     if var_file[0:2].lower() == "og":
-                        procdim = read.ogdim(datadir, proc)
+                        procdim = read.ogdim(datadir, iproc)
                     else:
                         if var_file[0:4] == "VARd":
-                            procdim = read.dim(datadir, proc, down=True)
+                            procdim = read.dim(datadir, iproc, down=True)
                         else:
-                            procdim = read.dim(datadir, proc)
+                            procdim = read.dim(datadir, iproc)
                     if not quiet:
                         print(
                             "Reading data from processor"
-                            + " {0} of {1} ...".format(proc, len(proc_dirs))
+                            + " {0} of {1} ...".format(iproc, len(proc_dirs))
                         )
 
                 else:
                     # A collective IO strategy is being used
+                    iproc = proc
                     procdim = dim
                 #                else:
                 #                    procdim.mx = dim.mx
@@ -547,112 +831,112 @@ class DataCube(object):
                 myloc = procdim.my
                 mzloc = procdim.mz
 
-                # Read the data: f-array
+                # Read the data: f-array and time, coordinates, etc.
+                # The persistent variables are only read with FortranFileExt.
+                # With several procs the f-array record is memory-mapped and
+                # copied from the page cache straight into the global array.
                 file_name = os.path.join(datadir, directory, var_file)
-                infile = FortranFileExt(file_name,header_dtype=np.int32)
-                if not run2D:
-                    f_loc = (infile.read_record(dtype=read_precision)).astype(precision)
-                    f_loc = f_loc.reshape((-1, mzloc, myloc, mxloc))
-                #    print(proc,f_loc.shape,f_loc.dtype)
+                lread_persist = lpersist and directory == proc_dirs[0]
+                if (
+                    _CythonFortranFile is not None
+                    and len(proc_dirs) == 1
+                    and not lread_persist
+                    and not _has_split_record(file_name)
+                ):
+                    if not quiet:
+                        print("Reading {0} with cython_fortran_file".format(file_name))
+                    infile = _CythonFortranFile(file_name)
+                    f_loc = infile.read_vector(read_precision)
+                    raw_etc = infile.read_vector(read_precision)
                 else:
-                    if dim.ny == 1:
-                        f_loc = (infile.read_record(dtype=read_precision)).astype(precision)
-                        f_loc = f_loc.reshape((-1, mzloc, mxloc))
+                    infile = FortranFileExt(file_name, header_dtype=np.int32)
+                    if len(proc_dirs) > 1:
+                        f_loc = infile.map_record(read_precision)
                     else:
-                        f_loc = (infile.read_record(dtype=read_precision)).astype(precision)
-                        f_loc = f_loc.reshape((-1, myloc, mxloc))
+                        f_loc = infile.read_record(dtype=read_precision)
+                    # t, x, y, z, dx, dy, dz and, with shear, deltay.
+                    n_etc = 1 + mxloc + myloc + mzloc + 3 + (1 if param.lshear else 0)
+                    raw_etc = infile.read_record_count(read_precision, n_etc)
+
+                    # Read the data: persistent variables
+                    if lread_persist:
+                        persist(self, infile=infile, precision=read_precision, quiet=quiet)
+                infile.close()
 
-                # Read the data: time, coordinates, etc.
-                raw_etc = (infile.read_record(dtype=read_precision)).astype(precision)
+                # f_loc stays in read_precision: with several procs only its
+                # own part is copied (and cast) into the global array below.
+                raw_etc = raw_etc.astype(precision, copy=False)
+                if not run2D:
+                    f_loc = f_loc.reshape((-1, mzloc, myloc, mxloc))
+                elif dim.ny == 1:
+                    f_loc = f_loc.reshape((-1, mzloc, mxloc))
+                else:
+                    f_loc = f_loc.reshape((-1, myloc, mxloc))
 
-                # Read the data: persistent variables
-                if lpersist and directory==proc_dirs[0]:
-                    persist(self, infile=infile, precision=read_precision, quiet=quiet)
-                infile.close()
+                if len(proc_dirs) == 1:
+                    return iproc, procdim, f_loc, raw_etc
 
-                t = raw_etc[0]
-                x_loc = raw_etc[1 : mxloc + 1]
-                y_loc = raw_etc[mxloc + 1 : mxloc + myloc + 1]
-                z_loc = raw_etc[mxloc + myloc + 1 : mxloc + myloc + mzloc + 1]
-                if param.lshear:
-                    shear_offset = 1
-                    deltay = raw_etc[-1]
+                # Calculate where the local processor will go in the global
+                # array. Ghost zones shared with a neighbouring processor are
+                # taken from the processor they are interior to.
+                xs, xsloc = _proc_slices(procdim.ipx, procdim.nx, mxloc, procdim.nghostx, dim.mx)
+                ys, ysloc = _proc_slices(procdim.ipy, procdim.ny, myloc, procdim.nghosty, dim.my)
+                zs, zsloc = _proc_slices(procdim.ipz, procdim.nz, mzloc, procdim.nghostz, dim.mz)
+                if not run2D:
+                    self.f[:, zs, ys, xs] = f_loc[:, zsloc, ysloc, xsloc]
                 else:
-                    shear_offset = 0
-
-                dx = raw_etc[-3 - shear_offset]
-                dy = raw_etc[-2 - shear_offset]
-                dz = raw_etc[-1 - shear_offset]
-
-                if len(proc_dirs) > 1:
-                    # Calculate where the local processor will go in
-                    # the global array.
-                    #
-                    # Don't overwrite ghost zones of processor to the
-                    # left (and accordingly in y and z direction -- makes
-                    # a difference on the diagonals)
-                    #
-                    # Recall that in NumPy, slicing is NON-INCLUSIVE on
-                    # the right end, ie, x[0:4] will slice all of a
-                    # 4-digit array, not produce an error like in idl.
-
-                    if procdim.ipx == 0:
-                        i0x = 0
-                        i1x = i0x + procdim.mx
-                        i0xloc = 0
-                        i1xloc = procdim.mx
-                    else:
-                        i0x = procdim.ipx * procdim.nx + procdim.nghostx
-                        i1x = i0x + procdim.mx - procdim.nghostx
-                        i0xloc = procdim.nghostx
-                        i1xloc = procdim.mx
-
-                    if procdim.ipy == 0:
-                        i0y = 0
-                        i1y = i0y + procdim.my
-                        i0yloc = 0
-                        i1yloc = procdim.my
+                    if dim.ny == 1:
+                        self.f[:, zs, xs] = f_loc[:, zsloc, xsloc]
                     else:
-                        i0y = procdim.ipy * procdim.ny + procdim.nghosty
-                        i1y = i0y + procdim.my - procdim.nghosty
-                        i0yloc = procdim.nghosty
-                        i1yloc = procdim.my
-
-                    if procdim.ipz == 0:
-                        i0z = 0
-                        i1z = i0z + procdim.mz
-                        i0zloc = 0
-                        i1zloc = procdim.mz
+                        self.f[zs, ys, xs] = f_loc[zsloc, ysloc, xsloc]
+
+                return iproc, procdim, None, raw_etc
+
+            # The proc files are independent, so read them concurrently;
+            # map() hands them back in proc order for the coordinates below.
+            nworkers = max(1, min(len(proc_dirs), os.cpu_count() or 1))
+            with ThreadPoolExecutor(max_workers=nworkers) as executor:
+                for iproc, procdim, f_loc, raw_etc in executor.map(read_proc, proc_dirs):
+                    mxloc = procdim.mx
+                    myloc = procdim.my
+                    mzloc = procdim.mz
+
+                    t = raw_etc[0]
+                    x_loc = raw_etc[1 : mxloc + 1]
+                    y_loc = raw_etc[mxloc + 1 : mxloc + myloc + 1]
+                    z_loc = raw_etc[mxloc + myloc + 1 : mxloc + myloc + mzloc + 1]
+                    if param.lshear:
+                        shear_offset = 1
+                        deltay = raw_etc[-1]
                     else:
-                        i0z = procdim.ipz * procdim.nz + procdim.nghostz
-                        i1z = i0z + procdim.mz - procdim.nghostz
-                        i0zloc = procdim.nghostz
-                        i1zloc = procdim.mz
-
-                    x[i0x:i1x] = x_loc[i0xloc:i1xloc]
-                    y[i0y:i1y] = y_loc[i0yloc:i1yloc]
-                    z[i0z:i1z] = z_loc[i0zloc:i1zloc]
-
-                    if not run2D:
-                        self.f[:, i0z:i1z, i0y:i1y, i0x:i1x] = f_loc[
-                            :, i0zloc:i1zloc, i0yloc:i1yloc, i0xloc:i1xloc
+                        shear_offset = 0
+
+                    dx = raw_etc[-3 - shear_offset]
+                    dy = raw_etc[-2 - shear_offset]
+                    dz = raw_etc[-1 - shear_offset]
+
+                    if len(proc_dirs) > 1:
+                        x_segments[procdim.ipx] = x_loc[
+                            _proc_slices(procdim.ipx, procdim.nx, mxloc, procdim.nghostx, dim.mx)[1]
                         ]
-                    else:
-                        if dim.ny == 1:
-                            self.f[:, i0z:i1z, i0x:i1x] = f_loc[
-                                :, i0zloc:i1zloc, i0xloc:i1xloc
-                            ]
-                        else:
-                            self.f[i0z:i1z, i0y:i1y, i0x:i1x] = f_loc[
-                                i0zloc:i1zloc, i0yloc:i1yloc, i0xloc:i1xloc
-                            ]
-                else:                    # reading from a single processor
-                    self.f = f_loc
-                    x = x_loc
-                    y = y_loc
-                    z = z_loc
-                    if grid != None:     # overwrite global grid by local grid to enable "magic" calculations
-                        grid = read.grid(datadir=datadir,proc=proc)
+                        y_segments[procdim.ipy] = y_loc[
+                            _proc_slices(procdim.ipy, procdim.ny, myloc, procdim.nghosty, dim.my)[1]
+                        ]
+                        z_segments[procdim.ipz] = z_loc[
+                            _proc_slices(procdim.ipz, procdim.nz, mzloc, procdim.nghostz, dim.mz)[1]
+                        ]
+                    else:                    # reading from a single processor
+                        self.f = f_loc.astype(precision, copy=False)
+                        x = x_loc
+                        y = y_loc
+                        z = z_loc
+                        if grid != None:     # overwrite global grid by local grid to enable "magic" calculations
+                            grid = read.grid(datadir=datadir,proc=iproc)
+
+            if len(proc_dirs) > 1:
+                x = np.concatenate([x_segments[ip] for ip in sorted(x_segments)])
+                y = np.concatenate([y_segments[ip] for ip in sorted(y_segments)])
+                z = np.concatenate([z_segments[ip] for ip in sorted(z_segments)])
         else:
             raise NotImplementedError(
                 "IO strategy {} not supported by the Python module.".format(
@@ -660,13 +944,43 @@ class DataCube(object):
                 )
             )
 
+        # Sort the index entries once: test-field components are set up
+        # separately from the other variables.
         aatest = []
         uutest = []
-        for key in index.__dict__.keys():
+        index_entries = []
+        for key, value in index.__dict__.items():
             if "aatest" in key:
                 aatest.append(key)
-            if "uutest" in key:
+            elif "uutest" in key:
                 uutest.append(key)
+            elif key not in _SKIP_KEYS:
+                index_entries.append((key, value))
+        # (name, first index) of each test-field vector, e.g. ("aatest1", 6).
+        aa_triples = [
+            (aatest[j * 3][:-1], index.__dict__[aatest[j * 3]])
+            for j in range(len(aatest) // 3)
+        ]
+        uu_triples = [
+            (uutest[j * 3][:-1], index.__dict__[uutest[j * 3]])
+            for j in range(len(uutest) // 3)
+        ]
+        # Slice removing the ghost zones, shared by f and the magic fields.
+        if not run2D:
+            trim_slice = np.s_[
+                :, dim.n1 : dim.n2 + 1, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
+            ]
+        elif dim.ny == 1:
+            trim_slice = np.s_[:, dim.n1 : dim.n2 + 1, dim.l1 : dim.l2 + 1]
+        else:
+            trim_slice = np.s_[:, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1]
+
+        def finish(field):
+            """Trim a freshly computed magic field into a contiguous array if asked."""
+            if trimall:
+                return np.ascontiguousarray(field[trim_slice])
+            return field
+
         if magic is not None:
             """
             In the functions curl and curl2, the arguments (dx,dy,dz,x,y) are ignored when grid is not None. Nevertheless, we pass them below to take care of the case where the user is trying to read a snapshot without the corresponding grid.dat being present (such as in the test test_read_var).
@@ -674,7 +988,7 @@ class DataCube(object):
             if "bb" in magic:
                 # Compute the magnetic field before doing trimall.
                 aa = self.f[index.ax - 1 : index.az, ...]
-                self.bb = curl(
+                self.bb = finish(curl(
                         aa,
                         dx=dx,
                         dy=dy,
@@ -684,17 +998,11 @@ class DataCube(object):
                         run2D=run2D,
                         coordinate_system=param.coord_system,
                         grid=grid,
-                )
-                if trimall:
-                    self.bb = self.bb[
-                        :, dim.n1 : dim.n2 + 1, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
-                    ]
+                ))
             if "bbtest" in magic:
                 if param.io_strategy == "HDF5":
                     # Compute the magnetic field before doing trimall.
-                    for j in range(int(len(aatest) / 3)):
-                        key = aatest[j*3][:-1]
-                        value = index.__dict__[aatest[j*3]]
+                    for key, value in aa_triples:
                         aa = self.f[value - 1 : value + 2, ...]
                         bb = curl(
                                 aa,
@@ -707,12 +1015,7 @@ class DataCube(object):
                                 coordinate_system=param.coord_system,
                                 grid=grid,
                         )
-                        if trimall:
-                            setattr(self,"bb"+key[2:],bb[
-                                :, dim.n1 : dim.n2 + 1, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
-                            ])
-                        else:
-                            setattr(self,"bb"+key[2:],bb)
+                        setattr(self,"bb"+key[2:],finish(bb))
                 else:
                     if hasattr(index, "aatest1"):
                         naatest = int(len(aatest) / 3)
@@ -731,16 +1034,11 @@ class DataCube(object):
                                     coordinate_system=param.coord_system,
                                     grid=grid,
                             )
-                            if trimall:
-                                setattr(self,"bb"+key[2:],bb[
-                                    :, dim.n1 : dim.n2 + 1, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
-                                ])
-                            else:
-                                setattr(self,"bb"+key[2:],bb)
+                            setattr(self,"bb"+key[2:],finish(bb))
             if "jj" in magic:
                 # Compute the electric current field before doing trimall.
                 aa = self.f[index.ax - 1 : index.az, ...]
-                self.jj = curl2(
+                self.jj = finish(curl2(
                         aa,
                         dx=dx,
                         dy=dy,
@@ -749,15 +1047,11 @@ class DataCube(object):
                         y=y,
                         coordinate_system=param.coord_system,
                         grid=grid,
-                )
-                if trimall:
-                    self.jj = self.jj[
-                        :, dim.n1 : dim.n2 + 1, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
-                    ]
+                ))
             if "vort" in magic:
                 # Compute the vorticity field before doing trimall.
                 uu = self.f[index.ux - 1 : index.uz, ...]
-                self.vort = curl(
+                self.vort = finish(curl(
                         uu,
                         dx=dx,
                         dy=dy,
@@ -767,39 +1061,16 @@ class DataCube(object):
                         run2D=run2D,
                         coordinate_system=param.coord_system,
                         grid=grid,
-                )
-                if trimall:
-                    if run2D:
-                        if dim.nz == 1:
-                            self.vort = self.vort[
-                                :, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
-                            ]
-                        else:
-                            self.vort = self.vort[
-                                :, dim.n1 : dim.n2 + 1, dim.l1 : dim.l2 + 1
-                            ]
-                    else:
-                        self.vort = self.vort[
-                            :,
-                            dim.n1 : dim.n2 + 1,
-                            dim.m1 : dim.m2 + 1,
-                            dim.l1 : dim.l2 + 1,
-                        ]
+                ))
 
         # Trim the ghost zones of the global f-array if asked.
         if trimall:
             self.x = x[dim.l1 : dim.l2 + 1]
             self.y = y[dim.m1 : dim.m2 + 1]
             self.z = z[dim.n1 : dim.n2 + 1]
-            if not run2D:
-                self.f = self.f[
-                    :, dim.n1 : dim.n2 + 1, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1
-                ]
-            else:
-                if dim.ny == 1:
-                    self.f = self.f[:, dim.n1 : dim.n2 + 1, dim.l1 : dim.l2 + 1]
-                else:
-                    self.f = self.f[:, dim.m1 : dim.m2 + 1, dim.l1 : dim.l2 + 1]
+            # One contiguous copy here instead of hidden ones downstream;
+            # this also frees the untrimmed array.
+            self.f = np.ascontiguousarray(self.f[trim_slice])
         else:
             self.x = x
             self.y = y
@@ -812,26 +1083,21 @@ class DataCube(object):
             self.n2 = dim.n2 + 1
 
         # Assign an attribute to self for each variable defined in
-        # 'data/index.pro' so that e.g. self.ux is the x-velocity
-        for key in index.__dict__.keys():
-            if (
-                key != "global_gg"
-                and key != "keys"
-                and "aatest" not in key
-                and "uutest" not in key
-            ):
-                value = index.__dict__[key]
-                if value <= index_max:
-                    setattr(self, key, self.f[value - 1, ...])
+        # 'data/index.pro' so that e.g. self.ux is the x-velocity.
+        # The views are collected first and set in one go at the end.
+        views = {}
+        for key, value in index_entries:
+            if value <= index_max:
+                views[key] = self.f[value - 1, ...]
         # Special treatment for vector quantities.
         if hasattr(index, "ux") and index.uz <= index_max:
-            setattr(self, "uu", self.f[index.ux - 1 : index.uz, ...])
+            views["uu"] = self.f[index.ux - 1 : index.uz, ...]
         if hasattr(index, "ax") and index.az <= index_max:
-            setattr(self, "aa", self.f[index.ax - 1 : index.az, ...])
+            views["aa"] = self.f[index.ax - 1 : index.az, ...]
         if hasattr(index, "uu_sph") and index.uu_sphz <= index_max:
-            self.uu_sph = self.f[index.uu_sphx - 1 : index.uu_sphz, ...]
+            views["uu_sph"] = self.f[index.uu_sphx - 1 : index.uu_sphz, ...]
         if hasattr(index, "bb_sph") and index.bb_sphz <= index_max:
-            self.bb_sph = self.f[index.bb_sphx - 1 : index.bb_sphz, ...]
+            views["bb_sph"] = self.f[index.bb_sphx - 1 : index.bb_sphz, ...]
         # Special treatment for test method vector quantities.
         # Note index 1,2,3,...,0 last vector may be the zero field/flow
         if param.io_strategy != "HDF5":
@@ -840,24 +1106,18 @@ class DataCube(object):
                 for j in range(0, naatest):
                     key = "aatest" + str(np.mod(j + 1, naatest))
                     value = index.__dict__["aatest1"] + 3 * j
-                    setattr(self, key, self.f[value - 1 : value + 2, ...])
+                    views[key] = self.f[value - 1 : value + 2, ...]
             if hasattr(index, "uutest1"):
                 nuutest = int(len(uutest) / 3)
                 for j in range(0, nuutest):
                     key = "uutest" + str(np.mod(j + 1, nuutest))
                     value = index.__dict__["uutest"] + 3 * j
-                    setattr(self, key, self.f[value - 1 : value + 2, ...])
+                    views[key] = self.f[value - 1 : value + 2, ...]
         else:
             #Dummy operation to be corrected
-            for j in range(int(len(aatest) / 3)):
-                key = aatest[j*3][:-1]
-                value = index.__dict__[aatest[j*3]]
-                setattr(self, key, self.f[value - 1 : value + 2, ...])
-            for j in range(int(len(uutest) / 3)):
-                key = uutest[j*3][:-1]
-                value = index.__dict__[uutest[j*3]]
-                setattr(self, key, self.f[value - 1 : value + 2, ...])
-
+            for key, value in aa_triples + uu_triples:
+                views[key] = self.f[value - 1 : value + 2, ...]
+        self.__dict__.update(views)
 
         self.t = t
         self.dx = dx
@@ -869,7 +1129,21 @@ class DataCube(object):
         # Do the rest of magic after the trimall (i.e. no additional curl.)
         self.magic = magic
         if self.magic is not None:
-            self.magic_attributes(param, dtype=dtype)
+            self.magic_attributes(param, dtype=dtype, inplace=magic_inplace)
+            if not keep_f:
+                # Keep only the magic fields, copied out of f where they are
+                # views of it, so that the memory of f can be released.
+                for key, value in list(self.__dict__.items()):
+                    if (
+                        key != "f"
+                        and isinstance(value, np.ndarray)
+                        and np.may_share_memory(value, self.f)
+                    ):
+                        if key in self.magic:
+                            setattr(self, key, value.copy())
+                        else:
+                            delattr(self, key)
+                self.f = None
         if timing:
             print("object completed in {:.2f} seconds.".format(time.time()-start_time))
 
@@ -878,110 +1152,142 @@ class DataCube(object):
         Sort array in a more natural way, e.g. 9VAR < 10VAR
         """
 
-        import re
-
         convert = lambda text: int(text) if text.isdigit() else text.lower()
-        alphanum_key = lambda key: [convert(c) for c in re.split("([0-9]+)", key)]
+        alphanum_key = lambda key: [convert(c) for c in _NATSORT_RE.split(key)]
         return sorted(procs_list, key=alphanum_key)
 
-    def magic_attributes(self, param, dtype=np.float64):
+    def magic_attributes(self, param, dtype=np.float64, inplace=False):
         """
         Compute some additional 'magic' quantities.
+
+        If inplace, rho and tt are exponentiated in place of lnrho and lnTT
+        once all other quantities are done, and lnrho and lnTT are removed.
+
+        With dtype np.float32, the thermodynamic quantities are computed in
+        single precision, otherwise in the precision of the data.
         """
 
         import sys
 
+        # With dtype=np.float32 the quantities below are computed in single
+        # precision throughout, else in the precision of the data.
+        single = np.dtype(dtype) == np.float32
+
+        def work(arr):
+            """
+            Input for the ufuncs below: NumPy only uses its SIMD exp/log
+            loops on contiguous arrays (a no-op for the f-array views).
+            """
+            if single:
+                return np.ascontiguousarray(arr, dtype=np.float32)
+            return np.ascontiguousarray(arr)
+
+        # Equation of state constants, computed on first use only as the
+        # magic quantities derived directly from lnrho or lnTT do not need them.
+        consts = None
+        # log(rho), shared by tt, ss and pp.
+        lnrho_cache = None
+
+        def get_lnrho():
+            """log(rho) from lnrho or rho, computed on first use."""
+            nonlocal lnrho_cache
+            if lnrho_cache is None:
+                if hasattr(self, "lnrho"):
+                    lnrho_cache = work(self.lnrho)
+                elif hasattr(self, "rho"):
+                    lnrho_cache = np.log(work(self.rho))
+                else:
+                    raise AttributeError(
+                        "Problem in magic: missing rho or lnrho variable"
+                    )
+            return lnrho_cache
+
         for field in self.magic:
-            if field == "rho" and not hasattr(self, "rho"):
+            if hasattr(self, field):
+                continue
+            if field == "rho":
                 if hasattr(self, "lnrho"):
-                    setattr(self, "rho", np.exp(self.lnrho))
+                    if not inplace:
+                        self.rho = np.exp(work(self.lnrho))
                 else:
                     raise AttributeError("Problem in magic: lnrho is missing")
 
-            if field == "tt" and not hasattr(self, "tt"):
+            if field == "tt":
                 if hasattr(self, "lnTT"):
-                    tt = np.exp(self.lnTT)
-                    setattr(self, "tt", tt)
+                    if not inplace:
+                        tt = np.exp(work(self.lnTT))
+                        self.tt = tt
                 else:
                     if hasattr(self, "ss"):
-                        if hasattr(self, "lnrho"):
-                            lnrho = self.lnrho
-                        elif hasattr(self, "rho"):
-                            lnrho = np.log(self.rho)
-                        else:
-                            raise AttributeError(
-                                "Problem in magic: missing rho or" + " lnrho variable"
-                            )
-                        cp = param.cp
-                        gamma = param.gamma
-                        cs20 = param.cs0 ** 2
-                        lnrho0 = np.log(param.rho0)
-                        lnTT0 = np.log(cs20 / (cp * (gamma - 1.0)))
-                        lnTT = (
-                            lnTT0
-                            + gamma / cp * self.ss
-                            + (gamma - 1.0) * (lnrho - lnrho0)
-                        )
-                        setattr(self, "tt", np.exp(lnTT))
+                        lnrho = get_lnrho()
+                        if consts is None:
+                            consts = _thermo_consts(param, dtype)
+                        tt = _compute_tt(work(self.ss), lnrho, consts)
+                        self.tt = tt
                     else:
                         raise AttributeError("Problem in magic: ss is missing ")
 
-            if field == "ss" and not hasattr(self, "ss"):
-                cp = param.cp
-                gamma = param.gamma
-                cs20 = param.cs0 ** 2
-                lnrho0 = np.log(param.rho0)
-                lnTT0 = np.log(cs20 / (cp * (gamma - 1.0)))
+            if field == "ss":
+                if consts is None:
+                    consts = _thermo_consts(param, dtype)
                 if hasattr(self, "lnTT"):
-                    setattr(
-                        self,
-                        "ss",
-                            cp
-                            / gamma
-                            * (
-                                self.lnTT
-                                - lnTT0
-                                - (gamma - 1.0) * (self.lnrho - lnrho0)
-                            )
-                    )
+                    ss = _compute_ss(work(self.lnTT), get_lnrho(), consts)
                 elif hasattr(self, "tt"):
-                    setattr(
-                        self,
-                        "ss",
-                            cp
-                            / gamma
-                            * (
-                                np.log(self.tt)
-                                - lnTT0
-                                - (gamma - 1.0) * (self.lnrho - lnrho0)
-                            )
-                    )
+                    # log(tt) is a temporary, so compute ss in its place.
+                    lnTT = np.log(work(self.tt))
+                    ss = _compute_ss(lnTT, get_lnrho(), consts, out=lnTT)
+                    del lnTT
                 else:
                     raise AttributeError("Problem in magic: missing lnTT or tt")
-
-            if field == "pp" and not hasattr(self, "pp"):
-                cp = param.cp
-                gamma = param.gamma
-                cv = cp / gamma
-                lnrho0 = np.log(param.rho0)
-                if hasattr(self, "lnrho"):
-                    lnrho = self.lnrho
-                elif hasattr(self, "rho"):
-                    lnrho = np.log(self.rho)
-                else:
-                    raise AttributeError("Problem in magic: missing rho or lnrho variable")
-                if hasattr(self, "ss"):
-                    cs20 = param.cs0 ** 2
-                    lnTT0 = np.log(cs20 / (cp * (gamma - 1.0)))
-                    setattr(self, "pp",
-                           (cp - cv) * np.exp(lnTT0 + gamma / cp * self.ss
-                                    + gamma * lnrho - (gamma - 1.0) * lnrho0))
-                elif hasattr(self, "lntt"):
-                    setattr(self, "pp", (cp - cv) * np.exp(self.lnTT + lnrho))
+                self.ss = ss
+
+            if field == "pp":
+                if consts is None:
+                    consts = _thermo_consts(param, dtype)
+                cp, cv = consts.cp, consts.cv
+                if (
+                    hasattr(self, "ss")
+                    and hasattr(self, "rho")
+                    and not hasattr(self, "lnrho")
+                ):
+                    pp = _compute_pp_from_rho(work(self.ss), work(self.rho), consts)
+                elif hasattr(self, "ss") or hasattr(self, "lnTT"):
+                    lnrho = get_lnrho()
+                    if hasattr(self, "ss"):
+                        pp = _compute_pp(work(self.ss), lnrho, consts)
+                    else:
+                        pp = np.add(work(self.lnTT), lnrho)
+                        np.exp(pp, out=pp)
+                        pp *= cp - cv
                 elif hasattr(self, "tt"):
-                    setattr(self, "pp", (cp - cv) * self.TT * np.exp(lnrho))
+                    # p = (cp-cv)*rho*T needs neither log(rho) nor exp(lnrho)
+                    # when rho is available.
+                    if hasattr(self, "rho"):
+                        rho = work(self.rho)
+                    elif hasattr(self, "lnrho"):
+                        rho = np.exp(work(self.lnrho))
+                    else:
+                        raise AttributeError(
+                            "Problem in magic: missing rho or lnrho variable"
+                        )
+                    tt = work(self.tt)
+                    pp = _thermo_out(None, tt.shape, tt, rho)
+                    np.multiply(tt, cp - cv, out=pp)
+                    pp *= rho
                 else:
-                    raise AttributeError("Problem in magic: missing ss or lntt or tt")
+                    raise AttributeError("Problem in magic: missing ss or lnTT or tt")
+                self.pp = pp
+
+        # Release log(rho) before lnrho/lnTT are exponentiated below.
+        lnrho = lnrho_cache = None
+
+        if inplace:
+            # lnrho and lnTT are not needed any more: reuse their memory.
+            for field, log_field in (("rho", "lnrho"), ("tt", "lnTT")):
+                if field in self.magic and not hasattr(self, field):
+                    log_value = getattr(self, log_field)
+                    setattr(self, field, np.exp(log_value, out=log_value))
+                    delattr(self, log_field)
 class _Persist():
     """
     Used to store the persistent variables
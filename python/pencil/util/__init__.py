@@ -15,6 +15,9 @@ import pathlib
 
 MARKER_FILES = ["run.in", "start.in", "src/cparam.local", "src/Makefile.local"]
 
+# Mantissa and exponent of a Fortran number whose "E" was cut, e.g. 3.76-291.
+_FFLOAT_RE = re.compile(r"(-?\d+\.?\d*)([+-]\d+)")
+
 
 def is_sim_dir(path="."):
     """Decide if a path is pointing at a pencil code simulation directory.
@@ -22,8 +25,32 @@ def is_sim_dir(path="."):
     The heuristics used is to check for the existence of start.in, run.in,
     src/ cparam.local and src/Makefile.local .
 
+    Each directory is listed once, rather than checking every marker file
+    with a separate stat call.
+
     """
-    return all([os.path.exists(os.path.join(path, f)) for f in MARKER_FILES])
+    markers = {}
+    for f in MARKER_FILES:
+        subdir, name = os.path.split(f)
+        markers.setdefault(subdir, set()).add(name)
+    for subdir, missing in markers.items():
+        try:
+            with os.scandir(os.path.join(path, subdir)) as entries:
+                # Stop listing as soon as all markers have been seen.
+                for entry in entries:
+                    # Like os.path.exists, ignore dangling symlinks; only
+                    # symlinks cost an extra stat call.
+                    if entry.name in missing and (
+                        not entry.is_symlink() or os.path.exists(entry.path)
+                    ):
+                        missing.discard(entry.name)
+                        if not missing:
+                            break
+        except OSError:
+            return False
+        if missing:
+            return False
+    return True
 
 
 def ffloat(x):
@@ -45,9 +72,9 @@ def ffloat(x):
     try:
         return float(x)
 
-    except:
+    except ValueError:
         warnings.warn("This usage of pc.util.ffloat will be removed soon. If you believe your use-case is legitimate, please email <pencil-code-python@googlegroups.com> describing it.")
-        val = re.sub(r"(-?\d+\.?\d*)([+-]\d+)", r"\1E\2", x)
+        val = _FFLOAT_RE.sub(r"\1E\2", x)
         return float(val)
 
 class PathWrapper(pathlib.WindowsPath if os.name == 'nt' else pathlib.PosixPath):
@@ -4,8 +4,12 @@
 """Test reading data files from Python"""
 
 
+import importlib
 import numpy as np
 import os
+import pytest
+import shutil
+import warnings
 from typing import Any, Tuple
 
 from test_utils import (
@@ -20,7 +24,7 @@ from pencil.read.timeseries import ts
 from pencil.read.dims import dim
 from pencil.read.varfile import var
 from pencil.read.params import param
-from pencil.read.powers import power
+from pencil.read.powers import Power, power
 
 
 DATA_DIR = os.path.realpath(
@@ -164,3 +168,398 @@ def test_read_power() -> None:
             np.allclose(expect, actual),
             "power.{}: expected {}, got {}".format(key, expect, actual),
         )
+        assert_true(key in dir(ps), "power.{}: missing from dir()".format(key))
+
+
+def test_parse_floats_malformed(monkeypatch) -> None:
+    """Fall back to ffloat for exponents written without the E"""
+    from pencil.read import powers
+
+    buf = b" 1.0E+00\n3.76-291   -2.0\n"
+    expect = np.array([1.0, 3.76e-291, -2.0])
+    assert_true(np.array_equal(powers._parse_floats(buf), expect))
+
+    # Older numpy versions return the numbers before the malformed one.
+    fromstring = np.fromstring
+    monkeypatch.setattr(
+        np,
+        "fromstring",
+        lambda string, sep, dtype: fromstring(string[:9], sep=sep, dtype=dtype),
+    )
+    assert_true(np.array_equal(powers._parse_floats(buf), expect))
+
+
+def test_read_power_warnings_filters() -> None:
+    """Reading the spectra (in threads) leaves the warnings filters alone"""
+    filters = list(warnings.filters)
+    power(datadir=DATA_DIR, quiet=True)
+    assert_equal(warnings.filters, filters)
+
+
+def test_read_power_nk_override() -> None:
+    """Subclasses can still override _get_nk_xyz(datadir)"""
+    calls = []
+
+    class PowerOverride(Power):
+        def _get_nk_xyz(self, datadir):
+            calls.append(datadir)
+            return 2
+
+    ps = PowerOverride()
+    ps.read(datadir=DATA_DIR, quiet=True)
+    assert_equal(calls, [DATA_DIR])
+    assert_true(
+        np.array_equal(ps.kin, power(datadir=DATA_DIR, quiet=True).kin),
+        "power: override of _get_nk_xyz changed the result",
+    )
+
+
+def test_read_power_cache(tmp_path) -> None:
+    """Read power spectra through the .npz cache"""
+    shutil.copytree(DATA_DIR, tmp_path, dirs_exist_ok=True)
+    datadir = str(tmp_path)
+
+    ps = power(datadir=datadir, quiet=True, cache=True)
+    assert_true(
+        os.path.exists(os.path.join(datadir, ".power_kin.dat.npz")),
+        "power: cache file was not written",
+    )
+    ps_cached = power(datadir=datadir, quiet=True, cache=True)
+
+    for key in ["t", "krms", "kin", "hel_kin"]:
+        expect = getattr(ps, key)
+        actual = getattr(ps_cached, key)
+        assert_true(
+            np.array_equal(expect, actual),
+            "power.{} (cached): expected {}, got {}".format(key, expect, actual),
+        )
+
+    # A cache written for a different nk must not be used.
+    class PowerNk1(Power):
+        def _get_nk_xyz(self, datadir):
+            return 1
+
+    ps_nk1 = PowerNk1()
+    ps_nk1.read(datadir=datadir, file_name="power_kin.dat", quiet=True, cache=True)
+    _assert_equal_tuple(ps_nk1.kin.shape, (3, 1))
+
+
+def test_read_power_krms_short(tmp_path) -> None:
+    """A power_krms.dat with fewer than nk values is an error"""
+    shutil.copytree(DATA_DIR, tmp_path, dirs_exist_ok=True)
+    datadir = str(tmp_path)
+    with open(os.path.join(datadir, "power_krms.dat"), "w") as f:
+        f.write("  0.00E+00\n")
+
+    with pytest.raises(ValueError):
+        power(datadir=datadir, file_name="power_krms.dat", quiet=True, cache=True)
+    assert_true(
+        not os.path.exists(os.path.join(datadir, ".power_krms.dat.npz")),
+        "power: short power_krms.dat was cached",
+    )
+
+
+def test_read_power_incomplete_record(tmp_path) -> None:
+    """An incomplete last record is an error for all the readers"""
+    shutil.copytree(DATA_DIR, tmp_path, dirs_exist_ok=True)
+    datadir = str(tmp_path)
+    # nxgrid = 4, so there are 2 values per record.
+    with open(os.path.join(datadir, "poweruz_x.dat"), "w") as f:
+        f.write("  1.0\n  1.0E+00  2.0E+00\n  2.0\n  3.0E+00  4.0E+00\n")
+
+    ps = power(datadir=datadir, file_name="poweruz_x.dat", quiet=True)
+    assert_true(np.array_equal(ps.t, [1.0, 2.0]))
+    assert_true(np.array_equal(ps.uz_x, [[1.0, 2.0], [3.0, 4.0]]))
+
+    for file_name in ["poweruz_x.dat", "power_kin.dat"]:
+        with open(os.path.join(datadir, file_name), "a") as f:
+            f.write("  3.0\n")
+        with pytest.raises(ValueError):
+            power(datadir=datadir, file_name=file_name, quiet=True)
+
+
+def _write_split_record(file_name: str, data: np.ndarray, nsplit: int = 2) -> None:
+    """
+    Append data as one record split into nsplit subrecords, with the
+    negative length markers gfortran uses for records over 2 GiB
+    (nsplit=1 writes a plain record).
+    """
+    chunks = np.array_split(np.ascontiguousarray(data).ravel(), nsplit)
+    with open(file_name, "ab") as outfile:
+        for i, chunk in enumerate(chunks):
+            size = chunk.nbytes
+            head = -size if i < nsplit - 1 else size
+            tail = -size if i > 0 else size
+            np.array([head], dtype=np.int32).tofile(outfile)
+            chunk.tofile(outfile)
+            np.array([tail], dtype=np.int32).tofile(outfile)
+
+
+def test_read_var_cython_fortran_file(tmp_path, monkeypatch) -> None:
+    """Read var.dat with the optional Cython reader, unless its first record is split"""
+    from scipy.io import FortranFile
+    from pencil.read.fortran_file import FortranFileExt
+
+    varfile_module = importlib.import_module("pencil.read.varfile")
+    expect = var("var.dat", DATA_DIR, proc=0, quiet=True)
+
+    opened = []
+
+    class RecordingReader:
+        """Stand-in for cython_fortran_file.FortranFile."""
+
+        def __init__(self, file_name):
+            opened.append(file_name)
+            self._file = FortranFileExt(file_name, header_dtype=np.int32)
+
+        def read_vector(self, dtype):
+            return self._file.read_record(dtype=dtype)
+
+        def close(self):
+            self._file.close()
+
+    monkeypatch.setattr(varfile_module, "_CythonFortranFile", RecordingReader)
+
+    plain_dir = str(tmp_path / "plain")
+    split_dir = str(tmp_path / "split")
+    shutil.copytree(DATA_DIR, plain_dir)
+    shutil.copytree(DATA_DIR, split_dir)
+
+    # Rewrite var.dat with the f-array record split into subrecords.
+    split_file = os.path.join(split_dir, "proc0", "var.dat")
+    infile = FortranFile(data_file("proc0/var.dat"), header_dtype=np.int32)
+    f_rec = infile.read_record(np.float32)
+    etc_rec = infile.read_record(np.float32)
+    infile.close()
+    os.remove(split_file)
+    _write_split_record(split_file, f_rec)
+    _write_split_record(split_file, etc_rec, nsplit=1)
+
+    for datadir, use_cython in [(plain_dir, True), (split_dir, False)]:
+        opened.clear()
+        data = var("var.dat", datadir, proc=0, quiet=True)
+        assert_equal(bool(opened), use_cython)
+        assert_true(np.array_equal(data.f, expect.f), "var.f differs")
+        for key in ["t", "x", "y", "z", "dx", "dy", "dz"]:
+            assert_true(
+                np.array_equal(getattr(data, key), getattr(expect, key)),
+                "var.{} differs".format(key),
+            )
+
+
+def _write_var_procs(
+    datadir: str, f: np.ndarray, etc: np.ndarray, nprocs: Tuple[int, int, int]
+) -> None:
+    """
+    Write the global f-array and time/grid record of serial-1 as a run on
+    nprocs = (nprocx, nprocy, nprocz) processors, with dim.dat files.
+    """
+    nvar, mz, my, mx = f.shape
+    nghost = 3
+    nprocx, nprocy, nprocz = nprocs
+    nx = (mx - 2 * nghost) // nprocx
+    ny = (my - 2 * nghost) // nprocy
+    nz = (mz - 2 * nghost) // nprocz
+    t = etc[0]
+    x = etc[1 : mx + 1]
+    y = etc[mx + 1 : mx + my + 1]
+    z = etc[mx + my + 1 : mx + my + mz + 1]
+    dxyz = etc[mx + my + mz + 1 :]
+
+    os.makedirs(datadir)
+    for name in ["index.pro", "param.nml"]:
+        shutil.copy(data_file(name), datadir)
+    with open(os.path.join(datadir, "dim.dat"), "w") as outfile:
+        outfile.write(
+            "{:7d}{:7d}{:7d}{:5d}{:5d}{:5d}\nS\n    3    3    3\n"
+            "{:5d}{:5d}{:5d}    1\n".format(mx, my, mz, nvar, 0, 0, *nprocs)
+        )
+    iproc = 0
+    for ipz in range(nprocz):
+        for ipy in range(nprocy):
+            for ipx in range(nprocx):
+                procdir = os.path.join(datadir, "proc{}".format(iproc))
+                os.makedirs(procdir)
+                with open(os.path.join(procdir, "dim.dat"), "w") as outfile:
+                    outfile.write(
+                        "{:7d}{:7d}{:7d}{:5d}{:5d}{:5d}\nS\n    3    3    3\n"
+                        "{:5d}{:5d}{:5d}\n".format(
+                            nx + 2 * nghost, ny + 2 * nghost, nz + 2 * nghost,
+                            nvar, 0, 0, ipx, ipy, ipz,
+                        )
+                    )
+                xs = slice(ipx * nx, (ipx + 1) * nx + 2 * nghost)
+                ys = slice(ipy * ny, (ipy + 1) * ny + 2 * nghost)
+                zs = slice(ipz * nz, (ipz + 1) * nz + 2 * nghost)
+                file_name = os.path.join(procdir, "var.dat")
+                _write_split_record(file_name, f[:, zs, ys, xs], nsplit=1)
+                _write_split_record(
+                    file_name,
+                    np.concatenate([[t], x[xs], y[ys], z[zs], dxyz]).astype(f.dtype),
+                    nsplit=1,
+                )
+                iproc += 1
+
+
+@pytest.mark.parametrize("nprocs", [(2, 1, 1), (1, 3, 5), (2, 2, 1)])
+def test_read_var_procs(tmp_path, nprocs) -> None:
+    """Read var.dat from several processors and compare with the serial run"""
+    from scipy.io import FortranFile
+
+    infile = FortranFile(data_file("proc0/var.dat"), header_dtype=np.int32)
+    f = infile.read_record(np.float32).reshape(5, 11, 12, 10)
+    etc = infile.read_record(np.float32)
+    infile.close()
+    # Make every value unique, so that misplaced processor data shows.
+    f = f + np.arange(f.size, dtype=np.float32).reshape(f.shape)
+
+    serial_dir = str(tmp_path / "serial")
+    procs_dir = str(tmp_path / "procs")
+    _write_var_procs(serial_dir, f, etc, (1, 1, 1))
+    _write_var_procs(procs_dir, f, etc, nprocs)
+
+    for trimall in [False, True]:
+        expect = var(datadir=serial_dir, trimall=trimall, quiet=True)
+        data = var(datadir=procs_dir, trimall=trimall, quiet=True)
+        for key in ["f", "t", "x", "y", "z", "dx", "dy", "dz"]:
+            assert_true(
+                np.array_equal(getattr(data, key), getattr(expect, key)),
+                "var.{} with {} procs differs from the serial read".format(
+                    key, nprocs
+                ),
+            )
+        if not trimall:
+            assert_true(np.array_equal(data.f, f), "var.f differs from written f")
+
+
+def test_fortran_file_records(tmp_path) -> None:
+    """Read plain and split records with read_record_count and map_record"""
+    from pencil.read.fortran_file import FortranFileExt
+
+    file_name = str(tmp_path / "records.dat")
+    records = [
+        np.arange(12, dtype=np.float32),
+        np.linspace(0.0, 1.0, 7),
+        np.arange(30, dtype=np.float64) ** 2,
+    ]
+    nsplits = [1, 1, 3]
+    for record, nsplit in zip(records, nsplits):
+        _write_split_record(file_name, record, nsplit=nsplit)
+
+    def read_all(method):
+        infile = FortranFileExt(file_name, header_dtype=np.int32)
+        data = [method(infile, record) for record in records]
+        infile.close()
+        return data
+
+    expect = read_all(
+        lambda infile, record: infile.read_record(dtype=record.dtype)
+    )
+    for record, value in zip(records, expect):
+        assert_true(np.array_equal(value, record), "read_record differs")
+
+    methods = {
+        "read_record_count": lambda infile, record: infile.read_record_count(
+            record.dtype, record.size
+        ),
+        # A wrong count falls back to read_record.
+        "read_record_count (wrong count)": (
+            lambda infile, record: infile.read_record_count(
+                record.dtype, record.size + 1
+            )
+        ),
+        "map_record": lambda infile, record: infile.map_record(record.dtype),
+    }
+    for name, method in methods.items():
+        for record, value in zip(records, read_all(method)):
+            assert_true(
+                value.dtype == record.dtype and np.array_equal(value, record),
+                "{} differs from read_record".format(name),
+            )
+
+
+def test_read_var_magic_inplace_keep_f() -> None:
+    """Read var.dat with magic_inplace and keep_f=False"""
+    magic = ["rho", "tt", "pp"]
+    expect = var("var.dat", DATA_DIR, proc=0, quiet=True, magic=magic)
+
+    data = var(
+        "var.dat", DATA_DIR, proc=0, quiet=True, magic=magic, magic_inplace=True
+    )
+    assert_true(not hasattr(data, "lnrho"), "var.lnrho kept with magic_inplace")
+    for key in magic + ["ss", "uu"]:
+        assert_true(
+            np.array_equal(getattr(data, key), getattr(expect, key)),
+            "var.{} with magic_inplace differs".format(key),
+        )
+    # rho replaced lnrho in f.
+    assert_true(np.array_equal(data.f[3], expect.rho), "var.f[3] is not rho")
+
+    for magic_inplace in [False, True]:
+        data = var(
+            "var.dat",
+            DATA_DIR,
+            proc=0,
+            quiet=True,
+            magic=magic,
+            magic_inplace=magic_inplace,
+            keep_f=False,
+        )
+        assert_true(data.f is None, "var.f kept with keep_f=False")
+        for key in ["uu", "ux", "lnrho", "ss"]:
+            assert_true(
+                not hasattr(data, key), "var.{} kept with keep_f=False".format(key)
+            )
+        for key in magic + ["t", "x", "y", "z", "dx"]:
+            assert_true(
+                np.array_equal(getattr(data, key), getattr(expect, key)),
+                "var.{} with keep_f=False differs".format(key),
+            )
+        # The magic fields must not depend on the released f-array.
+        for key in magic:
+            value = getattr(data, key)
+            assert_true(
+                value.base is None or value.base.size == value.size,
+                "var.{} still views a larger array".format(key),
+            )
+
+
+@pytest.mark.parametrize("gamma", [5.0 / 3.0, 1.4])
+def test_magic_pp(gamma) -> None:
+    """Derive the pressure from the different thermodynamic variables"""
+    from types import SimpleNamespace
+    from pencil.read.varfile import DataCube
+
+    params = SimpleNamespace(cp=2.5, gamma=gamma, cs0=0.8, rho0=1.3)
+    cv = params.cp / gamma
+    rng = np.random.default_rng(1)
+    lnrho = rng.normal(size=(4, 5, 6))
+    ss = rng.normal(size=(4, 5, 6))
+    # Closed form: p = rho*cs2/gamma, with the ideal gas sound speed.
+    cs2 = params.cs0**2 * np.exp(
+        gamma * ss / params.cp + (gamma - 1.0) * (lnrho - np.log(params.rho0))
+    )
+    pp = np.exp(lnrho) * cs2 / gamma
+    tt = cs2 / (params.cp * (gamma - 1.0))
+    # The ideal gas law p = (cp-cv)*rho*T.
+    assert_true(np.allclose(pp, (params.cp - cv) * np.exp(lnrho) * tt, rtol=1e-12))
+
+    inputs = {
+        "ss, lnrho": {"ss": ss, "lnrho": lnrho},
+        "ss, rho": {"ss": ss, "rho": np.exp(lnrho)},
+        "lnTT, lnrho": {"lnTT": np.log(tt), "lnrho": lnrho},
+        "lnTT, rho": {"lnTT": np.log(tt), "rho": np.exp(lnrho)},
+        "tt, lnrho": {"tt": tt, "lnrho": lnrho},
+        "tt, rho": {"tt": tt, "rho": np.exp(lnrho)},
+    }
+    for name, fields in inputs.items():
+        data = DataCube()
+        data.__dict__.update(fields)
+        data.magic = ["pp"]
+        data.magic_attributes(params)
+        assert_true(
+            np.allclose(data.pp, pp, rtol=1e-12, atol=0),
+            "pp from {} with gamma={}: max rel. error {}".format(
+                name, gamma, np.max(np.abs(data.pp / pp - 1))
+            ),
+        )
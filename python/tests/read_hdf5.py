@@ -58,3 +58,80 @@ def test_read_grid_nogrid():
     assert len(grid.z) == 288
     assert grid.y[10] == -1.8541666
     assert grid.dz_tilde[30] == 0
+
+def _write_var_h5(datadir, rng):
+    """
+    Write a small HDF5 simulation (index.pro from serial-1, 5 variables)
+    and return the f-array datasets written to allprocs/var.h5.
+    """
+    import h5py
+    import shutil
+
+    inputdir = os.path.join(datadir_nogrid, os.path.pardir)
+    os.makedirs(os.path.join(datadir, "allprocs"))
+    for name in ["param.nml", "param2.nml"]:
+        shutil.copy(os.path.join(datadir_nogrid, name), datadir)
+    shutil.copy(os.path.join(inputdir, "serial-1", "index.pro"), datadir)
+
+    nghost = 3
+    n = {"x": 4, "y": 3, "z": 2}
+    m = {c: n[c] + 2*nghost for c in n}
+    settings = {
+        "nx": n["x"], "ny": n["y"], "nz": n["z"],
+        "mx": m["x"], "my": m["y"], "mz": m["z"],
+        "l1": nghost, "l2": nghost + n["x"] - 1,
+        "m1": nghost, "m2": nghost + n["y"] - 1,
+        "n1": nghost, "n2": nghost + n["z"] - 1,
+        "nghost": nghost, "mvar": 5, "maux": 0, "mglobal": 0,
+        "nprocx": 1, "nprocy": 1, "nprocz": 1, "version": 0,
+        }
+    data = {}
+    with h5py.File(os.path.join(datadir, "allprocs", "var.h5"), "w") as f:
+        for key, val in settings.items():
+            f["settings/" + key] = np.array([val], dtype=np.int32)
+        f["settings/precision"] = np.array([b"D"], dtype=object)
+        for c in n:
+            f["grid/" + c] = np.linspace(-1, 1, m[c])
+            f["grid/d" + c] = 2/(m[c] - 1)
+            f["grid/d" + c + "_1"] = np.full(m[c], (m[c] - 1)/2)
+            f["grid/d" + c + "_tilde"] = np.zeros(m[c])
+            f["grid/L" + c] = 2.
+            f["grid/O" + c] = -1.
+        f["time"] = 1.25
+        for key in ["ux", "uy", "uz", "lnrho", "ss"]:
+            data[key] = rng.standard_normal((m["z"], m["y"], m["x"]))
+            f["data/" + key] = data[key]
+    return data
+
+def test_read_var(tmp_path):
+    """
+    Check that var.h5 is read into the f-array, also when converting to
+    another precision and reading only part of the domain
+    """
+    datadir = str(tmp_path)
+    data = _write_var_h5(datadir, np.random.default_rng(1))
+    index = pc.read.index(datadir=datadir)
+
+    var = pc.read.var(datadir=datadir, quiet=True)
+    assert var.f.dtype == np.float64
+    assert var.f.shape == (5, 8, 9, 10)
+    for key, val in data.items():
+        assert np.array_equal(var.f[getattr(index, key) - 1], val)
+    assert var.t == 1.25
+    assert np.array_equal(var.x, np.linspace(-1, 1, 10))
+
+    # irange_x includes its upper end, irange_y and irange_z do not.
+    var = pc.read.var(
+        datadir=datadir, quiet=True, precision="f", dtype=np.float32,
+        irange_x=(2, 6), irange_y=(1, 5),
+        )
+    assert var.f.dtype == np.float32
+    assert var.f.shape == (5, 8, 4, 5)
+    for key, val in data.items():
+        assert np.array_equal(
+            var.f[getattr(index, key) - 1], val[:, 1:5, 2:7].astype(np.float32)
+            )
+    assert var.t.dtype == np.float32
+    assert var.x.dtype == np.float32
+    assert np.array_equal(var.x, np.linspace(-1, 1, 10)[2:7].astype(np.float32))
+    assert np.array_equal(var.y, np.linspace(-1, 1, 9)[1:5].astype(np.float32))